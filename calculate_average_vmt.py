@@ -16,16 +16,42 @@ Categories:
 Excludes Butte-Silver Bow and Anaconda-Deer Lodge (treated as outside municipalities).
 """
 
-import json
+import hashlib
+import os
+import sys
+from functools import lru_cache
+
+import msgspec
+import numpy as np
+import shapely
+from shapely import make_valid
 from shapely.geometry import shape, MultiPolygon
 from shapely.ops import unary_union
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+# (is_inside, is_interstate, length_miles, crash_rate, total_crashes, daily_vmt)
+SegmentValues = Tuple[bool, bool, float, float, int, float]
+# (length_miles, crash_rate, total_crashes, daily_vmt) arrays for one category
+CategoryArrays = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+# segments classified per batch
+CHUNK_SIZE = 1000
+
+# treated as outside municipalities (consolidated city-counties)
+EXCLUDED_MUNICIPALITIES = ("Butte-Silver Bow", "Anaconda-Deer Lodge")
+
+# municipality union is cached as WKB here, keyed by a hash of the municipalities file's
+# contents, the cache version and the exclusion list
+MUNICIPALITY_CACHE_DIR = 'cache'
+# bump when create_municipality_union's repair/filtering logic changes
+MUNICIPALITY_CACHE_VERSION = 2
 
 
 def load_geojson(filepath: str) -> dict:
     """Load a GeoJSON file."""
-    with open(filepath, 'r') as f:
-        return json.load(f)
+    # read as bytes and decode with msgspec for speed
+    with open(filepath, 'rb') as f:
+        return msgspec.json.decode(f.read())
 
 
 def calculate_line_length_miles(coordinates: List[List[float]]) -> float:
@@ -33,52 +59,58 @@ def calculate_line_length_miles(coordinates: List[List[float]]) -> float:
     Calculate the length of a LineString in miles using Haversine formula.
     Coordinates are in [lon, lat] format.
     """
-    from math import radians, sin, cos, sqrt, atan2
+    coords = np.asarray(coordinates, dtype=np.float64)
+    if len(coords) < 2:
+        return 0.0
 
-    total_length = 0.0
-    for i in range(len(coordinates) - 1):
-        lon1, lat1 = coordinates[i]
-        lon2, lat2 = coordinates[i + 1]
+    R = 3958.8  # Earth's radius in miles
 
-        # haversine formula
-        R = 3958.8  # Earth's radius in miles
+    # haversine formula over all consecutive vertex pairs at once
+    lat = np.radians(coords[:, 1])
+    lon = np.radians(coords[:, 0])
+    delta_lat = np.diff(lat)
+    delta_lon = np.diff(lon)
 
-        lat1_rad = radians(lat1)
-        lat2_rad = radians(lat2)
-        delta_lat = radians(lat2 - lat1)
-        delta_lon = radians(lon2 - lon1)
+    a = np.sin(delta_lat / 2) ** 2 + np.cos(lat[:-1]) * \
+        np.cos(lat[1:]) * np.sin(delta_lon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
 
-        a = sin(delta_lat / 2) ** 2 + cos(lat1_rad) * \
-            cos(lat2_rad) * sin(delta_lon / 2) ** 2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    return float(R * c.sum())
 
-        total_length += R * c
 
-    return total_length
+@lru_cache(maxsize=None)
+def is_interstate_route(route: str) -> bool:
+    """Check if a route name is an interstate (has I- prefix); cached since only a few dozen routes repeat."""
+    return route.startswith('I-')
 
 
 def is_interstate(segment_key: str) -> bool:
     """Check if a road segment is an interstate (has I- prefix)."""
     dept_id = segment_key.split('_')[-1] if '_' in segment_key else ""
-    return dept_id.startswith('I-')
+    return is_interstate_route(dept_id)
 
 
 def create_municipality_union(municipalities_geojson: dict) -> MultiPolygon:
     """
-    Create a union of all municipality polygons, excluding Butte-Silver Bow and Anaconda-Deer Lodge.
+    Create a union of all municipality polygons, excluding EXCLUDED_MUNICIPALITIES.
+
+    The union is prepared so repeated intersects tests against it reuse GEOS's internal index.
     """
     polygons = []
-    excluded_names = ["Butte-Silver Bow", "Anaconda-Deer Lodge"]
 
     for feature in municipalities_geojson['features']:
         name = feature['properties'].get('NAME', '')
-        if name not in excluded_names:
+        if name not in EXCLUDED_MUNICIPALITIES:
             try:
-                geom = shape(feature['geometry'])
-                # attempt to fix invalid geometries (some municipal polys are broken)
-                if not geom.is_valid:
-                    geom = geom.buffer(0)
-                if geom.is_valid:
+                # fix invalid geometries (some municipal polys are broken); make_valid returns
+                # already-valid input as-is, so there's no separate is_valid check up front
+                geom = make_valid(shape(feature['geometry']))
+                # make_valid can collapse a polygon to lines/points or return a collection with
+                # stray ones; keep only the polygonal parts (an empty union if there are none)
+                if geom.geom_type not in ('Polygon', 'MultiPolygon'):
+                    geom = unary_union(
+                        [g for g in shapely.get_parts(geom) if g.geom_type in ('Polygon', 'MultiPolygon')])
+                if not geom.is_empty:
                     polygons.append(geom)
                 else:
                     print(
@@ -87,175 +119,259 @@ def create_municipality_union(municipalities_geojson: dict) -> MultiPolygon:
                 print(f"Warning: Could not process municipality {name}: {e}")
 
     print(
-        f"Loaded {len(polygons)} municipalities (excluding Butte-Silver Bow and Anaconda-Deer Lodge)")
+        f"Loaded {len(polygons)} municipalities (excluding {' and '.join(EXCLUDED_MUNICIPALITIES)})")
 
     # union of all municipality polygons
     if polygons:
         municipality_union = unary_union(polygons)
+        shapely.prepare(municipality_union)
         return municipality_union
     return None
 
 
-def categorize_segments(traffic_geojson: dict, municipality_union) -> Dict[str, List[dict]]:
+def load_municipality_union(filepath: str) -> MultiPolygon:
     """
-    Categorize road segments based on location (in/out of municipalities) and type (interstate/non-interstate).
+    Load the prepared municipality union, reusing the on-disk WKB cache when the
+    municipalities file, exclusion list and cache version haven't changed since it was written.
+    """
+    # hash the contents rather than trusting mtime, which cp -p/rsync/archive extracts preserve
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+    content_hash = hashlib.sha1(raw).hexdigest()[:16]
+    excluded_hash = hashlib.sha1(
+        '\n'.join(EXCLUDED_MUNICIPALITIES).encode('utf-8')).hexdigest()[:8]
+    cache_path = os.path.join(
+        MUNICIPALITY_CACHE_DIR,
+        f"muni_union_{content_hash}_v{MUNICIPALITY_CACHE_VERSION}_{excluded_hash}.wkb")
+
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                municipality_union = shapely.from_wkb(f.read())
+            shapely.prepare(municipality_union)
+            print(f"Loaded municipality union from cache ({cache_path})")
+            return municipality_union
+        except Exception as e:
+            # truncated or corrupt cache: drop it and rebuild below
+            print(f"Warning: Ignoring unreadable municipality cache {cache_path}: {e}")
+            os.remove(cache_path)
+
+    # decode the bytes already read for the hash rather than reading the file again
+    municipality_union = create_municipality_union(msgspec.json.decode(raw))
+    if municipality_union is not None:
+        os.makedirs(MUNICIPALITY_CACHE_DIR, exist_ok=True)
+        # drop caches for older versions of the file
+        for name in os.listdir(MUNICIPALITY_CACHE_DIR):
+            if name.startswith('muni_union_') and name.endswith('.wkb'):
+                os.remove(os.path.join(MUNICIPALITY_CACHE_DIR, name))
+        # write to a temp file and rename so an interrupted run can't leave a partial cache
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(shapely.to_wkb(municipality_union))
+        os.replace(tmp_path, cache_path)
+    return municipality_union
+
+
+def municipality_flags(features: List[dict], municipality_union) -> np.ndarray:
+    """
+    Return a bool array marking which features intersect the municipality union.
 
-    Returns a dictionary with keys:
-    - 'all_outside'
-    - 'non_interstate_outside'
-    - 'interstate_outside'
-    - 'all_inside'
-    - 'non_interstate_inside'
-    - 'interstate_inside'
+    LineStrings are built in one shapely.linestrings call from a flat coordinate array and
+    tested with a single vectorized intersects call instead of constructing and testing each segment.
+    """
+    if municipality_union is None or not features:
+        return np.zeros(len(features), dtype=bool)
 
-    Each value is a list of dicts with keys: 'length_miles', 'crash_rate'
+    geoms = np.empty(len(features), dtype=object)
+    line_positions = []
+    line_coords = []
+    for i, feature in enumerate(features):
+        geometry = feature['geometry']
+        if geometry['type'] == 'LineString' and len(geometry['coordinates']) >= 2:
+            line_positions.append(i)
+            line_coords.append(geometry['coordinates'])
+        else:
+            geoms[i] = shape(geometry)
+
+    if line_coords:
+        counts = np.fromiter((len(c) for c in line_coords),
+                             dtype=np.intp, count=len(line_coords))
+        # positions may be [lon, lat] or [lon, lat, z]; intersects is 2D, so keep lon/lat
+        flat = np.array([pt[:2] for c in line_coords for pt in c], dtype=np.float64)
+        geoms[line_positions] = shapely.linestrings(
+            flat, indices=np.repeat(np.arange(len(line_coords)), counts))
+
+    # the union is prepared, so this is one GEOS loop of indexed tests; no covers() pre-check
+    # since prepared intersects already short-circuits on a vertex inside a polygon
+    return shapely.intersects(geoms, municipality_union)
+
+
+def classify_segment(feature: dict) -> Optional[Tuple[bool, float, float, int, float]]:
     """
-    categories = {
-        'all_outside': [],
-        'non_interstate_outside': [],
-        'interstate_outside': [],
-        'all_inside': [],
-        'non_interstate_inside': [],
-        'interstate_inside': []
-    }
+    Compute the interstate flag and per-segment values for a single road segment from its properties.
 
-    total_segments = len(traffic_geojson['features'])
-    print(f"\nProcessing {total_segments} road segments...")
+    Returns (is_interstate, length_miles, crash_rate, total_crashes, daily_vmt),
+    or None if the segment is skipped.
+    """
+    properties = feature['properties']
+    geometry = feature['geometry']
+
+    # skip if missing required data
+    if 'PER_100M_VMT' not in properties or properties['PER_100M_VMT'] is None:
+        return None
+
+    try:
+        crash_rate = float(properties['PER_100M_VMT'])
+    except (ValueError, TypeError):
+        return None  # skip segments with invalid crash rate data
+
+    segment_key = properties.get('SEGMENT_KEY', '')
+
+    # prefer SEC_LNT_MI (official segment length) when present, otherwise fall back to geometry
+    length_miles = None
+    sec_lnt_val = None
+    try:
+        sec_lnt = properties.get('SEC_LNT_MI')
+        if sec_lnt is not None and str(sec_lnt).strip() != '':
+            sec_lnt_val = float(sec_lnt)
+            length_miles = sec_lnt_val
+    except (ValueError, TypeError):
+        sec_lnt_val = None
+        length_miles = None
 
-    for idx, feature in enumerate(traffic_geojson['features']):
-        if idx % 1000 == 0:
-            print(f"  Processed {idx}/{total_segments} segments...")
+    # ff no valid SEC_LNT_MI, compute from geometry
+    if length_miles is None:
+        if geometry['type'] == 'LineString':
+            length_miles = calculate_line_length_miles(
+                geometry['coordinates'])
+        else:
+            return None  # skip non-LineString geometries
 
-        properties = feature['properties']
-        geometry = feature['geometry']
+    # determine if interstate: prefer SIGNED_ROUTE if available, otherwise fall back to SEGMENT_KEY parsing
+    signed_route = (properties.get('SIGNED_ROUTE') or '')
+    if signed_route and is_interstate_route(str(signed_route)):
+        is_i = True
+    else:
+        is_i = is_interstate(segment_key)
 
-        # skip if missing required data
-        if 'PER_100M_VMT' not in properties or properties['PER_100M_VMT'] is None:
-            continue
+    if crash_rate <= 0:
+        return None
 
+    total_crashes = 0
+    for crash_key in ('TOTAL_CRASHES', 'TOTAL', 'TOTAL_CRASHES_5YR', 'TOTAL_CRASH'):
+        val = properties.get(crash_key)
+        if val is None:
+            continue
         try:
-            crash_rate = float(properties['PER_100M_VMT'])
+            total_crashes = int(float(val))
+            break
         except (ValueError, TypeError):
-            continue  # skip segments with invalid crash rate data
-
-        segment_key = properties.get('SEGMENT_KEY', '')
+            continue
 
-        # prefer SEC_LNT_MI (official segment length) when present, otherwise fall back to geometry
-        length_miles = None
-        sec_lnt_val = None
+    # find AADT-like value
+    aadt = 0.0
+    for k in ("TYC_AADT", "AADT", "AVG_AADT", "TYC_AADT_EST", "EST_AADT"):
+        v = properties.get(k)
+        if v is None:
+            continue
         try:
-            sec_lnt = properties.get('SEC_LNT_MI')
-            if sec_lnt is not None and str(sec_lnt).strip() != '':
-                sec_lnt_val = float(sec_lnt)
-                length_miles = sec_lnt_val
+            aadt = float(v)
+            if aadt > 0:
+                break
         except (ValueError, TypeError):
-            sec_lnt_val = None
-            length_miles = None
-
-        # ff no valid SEC_LNT_MI, compute from geometry
-        if length_miles is None:
-            if geometry['type'] == 'LineString':
-                length_miles = calculate_line_length_miles(
-                    geometry['coordinates'])
-            else:
-                continue  # skip non-LineString geometries
-
-        # determine if interstate: prefer SIGNED_ROUTE if available, otherwise fall back to SEGMENT_KEY parsing
-        signed_route = (properties.get('SIGNED_ROUTE') or '')
-        if signed_route and str(signed_route).startswith('I-'):
-            is_i = True
-        else:
-            is_i = is_interstate(segment_key)
+            continue
 
-        line_geom = shape(geometry)
-        is_inside = False
+    # use SEC_LNT_MI for VMT calculation when available, otherwise fall back to computed length_miles
+    sec_len_for_vmt = sec_lnt_val if sec_lnt_val is not None else length_miles
+    daily_vmt = sec_len_for_vmt * \
+        aadt if (sec_len_for_vmt is not None and aadt > 0) else 0.0
 
-        if municipality_union:
-            try:
-                is_inside = line_geom.intersects(municipality_union)
-            except Exception as e:
-                print(
-                    f"Warning: Error checking intersection for segment {segment_key}: {e}")
-                is_inside = False
+    return is_i, length_miles, crash_rate, total_crashes, daily_vmt
 
-        if crash_rate <= 0:
-            continue
 
-        total_crashes = 0
-        for crash_key in ('TOTAL_CRASHES', 'TOTAL', 'TOTAL_CRASHES_5YR', 'TOTAL_CRASH'):
-            val = properties.get(crash_key)
-            if val is None:
-                continue
-            try:
-                total_crashes = int(float(val))
-                break
-            except (ValueError, TypeError):
-                continue
-
-        # find AADT-like value
-        aadt = 0.0
-        for k in ("TYC_AADT", "AADT", "AVG_AADT", "TYC_AADT_EST", "EST_AADT"):
-            v = properties.get(k)
-            if v is None:
-                continue
-            try:
-                aadt = float(v)
-                if aadt > 0:
-                    break
-            except (ValueError, TypeError):
-                continue
-
-        # use SEC_LNT_MI for VMT calculation when available, otherwise fall back to computed length_miles
-        sec_len_for_vmt = sec_lnt_val if sec_lnt_val is not None else length_miles
-        daily_vmt = sec_len_for_vmt * \
-            aadt if (sec_len_for_vmt is not None and aadt > 0) else 0.0
-
-        # create segment data
-        segment_data = {
-            'length_miles': length_miles,
-            'crash_rate': crash_rate,
-            'segment_key': segment_key,
-            'total_crashes': total_crashes,
-            'daily_vmt': daily_vmt
-        }
-
-        # categorize
-        if is_inside:
-            categories['all_inside'].append(segment_data)
-            if is_i:
-                categories['interstate_inside'].append(segment_data)
-            else:
-                categories['non_interstate_inside'].append(segment_data)
-        else:
-            categories['all_outside'].append(segment_data)
-            if is_i:
-                categories['interstate_outside'].append(segment_data)
-            else:
-                categories['non_interstate_outside'].append(segment_data)
+def classify_segments(features: List[dict], municipality_union) -> List[Optional[SegmentValues]]:
+    """
+    Classify a batch of segments, testing their geometries against the municipalities at once.
 
-    print(f"  Processed {total_segments}/{total_segments} segments.")
+    Properties are checked first so geometries are only built for segments that are kept.
+    """
+    values = [classify_segment(feature) for feature in features]
+    kept = [i for i, v in enumerate(values) if v is not None]
+    is_inside = municipality_flags(
+        [features[i] for i in kept], municipality_union)
 
-    return categories
+    results = [None] * len(features)
+    for i, flag in zip(kept, is_inside):
+        results[i] = (bool(flag),) + values[i]
+    return results
 
 
-def calculate_weighted_average(segments: List[dict]) -> Tuple[float, float, float]:
-    if not segments:
-        return 0.0, 0.0, 0.0
+def categorize_segments(features: List[dict], municipality_union) -> Dict[str, CategoryArrays]:
+    """
+    Categorize road segments based on location (in/out of municipalities) and type (interstate/non-interstate).
 
-    total_weighted_rate = 0.0
-    total_length = 0.0
+    Returns a dictionary with keys:
+    - 'all_outside'
+    - 'non_interstate_outside'
+    - 'interstate_outside'
+    - 'all_inside'
+    - 'non_interstate_inside'
+    - 'interstate_inside'
 
-    for segment in segments:
-        length = segment['length_miles']
-        rate = segment['crash_rate']
+    Each value is a tuple of NumPy arrays (length_miles, crash_rate, total_crashes, daily_vmt)
+    with one entry per segment in that category.
+    """
+    total_segments = len(features)
+    print(f"\nProcessing {total_segments} road segments...")
+
+    chunks = [features[i:i + CHUNK_SIZE]
+              for i in range(0, total_segments, CHUNK_SIZE)]
+    results = []
+    # progress lines are only useful interactively; skip them when output is redirected
+    show_progress = sys.stdout.isatty()
+    for chunk in chunks:
+        results.extend(classify_segments(chunk, municipality_union))
+        if show_progress:
+            print(f"  Processed {len(results)}/{total_segments} segments...")
+
+    kept = [result for result in results if result is not None]
+    skipped = len(results) - len(kept)
+    if skipped:
+        print(f"  Skipped {skipped} segments without a positive crash rate or usable length.")
+
+    # one array per value across all kept segments; categories are boolean masks over them
+    columns = list(zip(*kept)) or [()] * 6
+    inside = np.array(columns[0], dtype=bool)
+    interstate = np.array(columns[1], dtype=bool)
+    lengths = np.array(columns[2], dtype=np.float64)
+    rates = np.array(columns[3], dtype=np.float64)
+    crashes = np.array(columns[4], dtype=np.int64)
+    daily_vmt = np.array(columns[5], dtype=np.float64)
+
+    masks = {
+        'all_outside': ~inside,
+        'non_interstate_outside': ~inside & ~interstate,
+        'interstate_outside': ~inside & interstate,
+        'all_inside': inside,
+        'non_interstate_inside': inside & ~interstate,
+        'interstate_inside': inside & interstate
+    }
+    return {
+        key: (lengths[mask], rates[mask], crashes[mask], daily_vmt[mask])
+        for key, mask in masks.items()
+    }
+
+
+def calculate_weighted_average(lengths: np.ndarray, rates: np.ndarray) -> Tuple[float, float, float]:
+    if len(lengths) == 0:
+        return 0.0, 0.0, 0.0
 
-        total_weighted_rate += rate * length
-        total_length += length
+    total_length = float(lengths.sum())
 
     if total_length == 0:
         return 0.0, 0.0, 0.0
 
-    weighted_avg = total_weighted_rate / total_length
+    weighted_avg = float(np.dot(rates, lengths)) / total_length
 
     miles_per_crash = 100_000_000 / \
         weighted_avg if weighted_avg > 0 else float('inf')
@@ -268,11 +384,12 @@ def main():
     print("Loading GeoJSON files...")
     traffic_data = load_geojson(
         'output/merged_data/merged_traffic_lines.geojson')
-    municipalities_data = load_geojson('data/mt-municipalities-1m.geojson')
 
     print("\nCreating municipality boundary union...")
-    municipality_union = create_municipality_union(municipalities_data)
-    categories = categorize_segments(traffic_data, municipality_union)
+    municipality_union = load_municipality_union(
+        'data/mt-municipalities-1m.geojson')
+    categories = categorize_segments(
+        traffic_data.get('features', []), municipality_union)
     print("\n" + "="*80)
     print("LENGTH-WEIGHTED AVERAGE CRASH RATES BY CATEGORY")
     print("="*80)
@@ -289,17 +406,16 @@ def main():
     results = {}
 
     for key, name in category_names.items():
-        segments = categories[key]
+        lengths, rates, crashes, daily_vmt = categories[key]
         avg_rate, total_length, miles_per_crash = calculate_weighted_average(
-            segments)
+            lengths, rates)
         results[key] = (avg_rate, total_length, miles_per_crash)
 
         print("\n" + name)
-        print("  Number of segments: {}".format(len(segments)))
+        print("  Number of segments: {}".format(len(lengths)))
         # compute totals: total accidents and total daily miles
-        total_accidents = sum(int(s.get('total_crashes', 0)) for s in segments)
-        total_daily_miles = sum(float(s.get('daily_vmt', 0.0))
-                                for s in segments)
+        total_accidents = int(crashes.sum())
+        total_daily_miles = float(daily_vmt.sum())
         print(f"  Total accidents: {total_accidents:,}")
         print(f"  Total daily miles: {total_daily_miles:,.0f}")
         print(f"  Total road miles: {total_length:,.2f}")
@@ -312,18 +428,17 @@ def main():
     # ------------------------------------------------------------------
     # Aggregate across ALL roads (ignore municipality split)
     # ------------------------------------------------------------------
-    all_segments = categories['all_outside'] + categories['all_inside']
+    all_lengths, all_rates, all_crashes, all_daily_vmt = (
+        np.concatenate(pair) for pair in zip(categories['all_outside'], categories['all_inside']))
     all_avg_rate, all_total_length, all_miles_per_crash = calculate_weighted_average(
-        all_segments)
-    all_total_accidents = sum(int(s.get('total_crashes', 0))
-                              for s in all_segments)
-    all_total_daily_miles = sum(float(s.get('daily_vmt', 0.0))
-                                for s in all_segments)
+        all_lengths, all_rates)
+    all_total_accidents = int(all_crashes.sum())
+    all_total_daily_miles = float(all_daily_vmt.sum())
 
     print("\n" + "="*60)
     print("ALL ROADS (no municipality split)")
     print("="*60)
-    print(f"  Number of segments: {len(all_segments)}")
+    print(f"  Number of segments: {len(all_lengths)}")
     print(f"  Total accidents: {all_total_accidents:,}")
     print(f"  Total daily miles: {all_total_daily_miles:,.0f}")
     print(f"  Total road miles: {all_total_length:,.2f}")
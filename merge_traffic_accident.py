@@ -1,10 +1,17 @@
 import os
-import json
 import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
 import numpy as np
 import pandas as pd
 import msgspec
 
+# columns actually used from the yearly TYC CSVs and the on-system routes file;
+# the files carry 40+ columns, so reading only these keeps ingest small
+TYC_COLUMNS = ('CORR_ID', 'DEPT_ID', 'CORR_MP',
+               'CORR_ENDMP', 'TYC_AADT', 'SEC_LNT_MI')
+ON_SYSTEM_COLUMNS = ('DEPARTMENTAL ROUTE', 'SIGNED ROUTE')
+
 
 def parse_milepost(mp_str):
     if pd.isna(mp_str):
@@ -18,38 +25,72 @@ def parse_milepost(mp_str):
         return None
 
 
+def parse_milepost_series(mp):
+    # vectorized parse_milepost: NaN wherever the scalar version returns None
+    parts = mp.astype('string').str.split('+', expand=True)
+    if parts.shape[1] < 2:
+        return pd.Series(np.nan, index=mp.index)
+    whole = pd.to_numeric(parts[0].str.lstrip('0').replace('', '0'), errors='coerce')
+    frac = pd.to_numeric(parts[1], errors='coerce')
+    out = (whole + frac).astype(float)
+    if parts.shape[1] > 2:
+        out[parts[2].notna()] = np.nan
+    return out
+
+
+def build_segment_key(df):
+    # CORR_ID_CORR_MP_CORR_ENDMP_DEPT_ID, concatenated over the object arrays in
+    # one pass rather than a temporary Series per '+'; missing mileposts give NaN
+    mp = df['CORR_MP'].to_numpy(dtype=object)
+    endmp = df['CORR_ENDMP'].to_numpy(dtype=object)
+    missing = pd.isna(mp) | pd.isna(endmp)
+    keys = (df['CORR_ID'].to_numpy(dtype=object) + '_' + np.where(missing, '', mp) +
+            '_' + np.where(missing, '', endmp) + '_' + df['DEPT_ID'].to_numpy(dtype=object))
+    keys[missing] = np.nan
+    return pd.Series(keys, index=df.index)
+
+
 def load_base_segments_2023(base_csv='data/Traffic_Yearly_Counts_2023/TYC_2023.csv'):
     if not os.path.exists(base_csv):
         raise FileNotFoundError(base_csv)
-    df = pd.read_csv(base_csv, dtype=str)
+    df = pd.read_csv(base_csv, dtype=str, usecols=lambda c: c in TYC_COLUMNS)
     df['CORR_ID'] = df['CORR_ID'].astype(str).str.strip().str.upper()
     df['DEPT_ID'] = df['DEPT_ID'].astype(str).str.strip().str.upper()
-    df['SEGMENT_KEY'] = (df['CORR_ID'] + '_' + df['CORR_MP'] +
-                         '_' + df['CORR_ENDMP'] + '_' + df['DEPT_ID'])
-    df['CORR_MP_FLOAT'] = df['CORR_MP'].apply(parse_milepost)
-    df['CORR_ENDMP_FLOAT'] = df['CORR_ENDMP'].apply(parse_milepost)
+    df['SEGMENT_KEY'] = build_segment_key(df)
+    df['CORR_MP_FLOAT'] = parse_milepost_series(df['CORR_MP'])
+    df['CORR_ENDMP_FLOAT'] = parse_milepost_series(df['CORR_ENDMP'])
     df['TYC_AADT'] = pd.to_numeric(df.get('TYC_AADT', ''), errors='coerce')
     df['YEARS_WITH_DATA'] = 1
     return df
 
 
+def _load_year_aadt(year):
+    # SEGMENT_KEY / TYC_AADT for one year's counts, or None if the file is absent
+    csv_path = f'data/Traffic_Yearly_Counts_{year}/TYC_{year}.csv'
+    if not os.path.exists(csv_path):
+        return None
+    ydf = pd.read_csv(csv_path, dtype=str,
+                      usecols=lambda c: c in TYC_COLUMNS)
+    ydf['CORR_ID'] = ydf['CORR_ID'].astype(str).str.strip().str.upper()
+    ydf['DEPT_ID'] = ydf['DEPT_ID'].astype(str).str.strip().str.upper()
+    ydf['SEGMENT_KEY'] = build_segment_key(ydf)
+    ydf['TYC_AADT'] = pd.to_numeric(
+        ydf.get('TYC_AADT', ''), errors='coerce')
+    return ydf[['SEGMENT_KEY', 'TYC_AADT']]
+
+
 def calculate_averaged_traffic(base_df, years=[2023, 2022, 2021, 2020, 2019]):
     # aggregate TYC_AADT by SEGMENT_KEY across years and compute mean and count
     parts = []
     # include base year from base_df
     parts.append(base_df[['SEGMENT_KEY', 'TYC_AADT']].copy())
-    for year in years[1:]:
-        csv_path = f'data/Traffic_Yearly_Counts_{year}/TYC_{year}.csv'
-        if not os.path.exists(csv_path):
-            continue
-        ydf = pd.read_csv(csv_path, dtype=str)
-        ydf['CORR_ID'] = ydf['CORR_ID'].astype(str).str.strip().str.upper()
-        ydf['DEPT_ID'] = ydf['DEPT_ID'].astype(str).str.strip().str.upper()
-        ydf['SEGMENT_KEY'] = (ydf['CORR_ID'] + '_' + ydf['CORR_MP'] +
-                              '_' + ydf['CORR_ENDMP'] + '_' + ydf['DEPT_ID'])
-        ydf['TYC_AADT'] = pd.to_numeric(
-            ydf.get('TYC_AADT', ''), errors='coerce')
-        parts.append(ydf[['SEGMENT_KEY', 'TYC_AADT']])
+    # the yearly files are independent; the C parser releases the GIL, so
+    # threads overlap the reads. map() keeps the results in year order.
+    other_years = years[1:]
+    if other_years:
+        with ThreadPoolExecutor(max_workers=min(len(other_years), 8)) as ex:
+            parts.extend(ydf for ydf in ex.map(_load_year_aadt, other_years)
+                         if ydf is not None)
 
     if not parts:
         return base_df
@@ -71,51 +112,67 @@ def calculate_averaged_traffic(base_df, years=[2023, 2022, 2021, 2020, 2019]):
 
 def build_corridor_index(segments_df):
     # build numpy-backed per-corridor interval index for fast lookup
-    temp = {}
-    for _, r in segments_df.iterrows():
-        corr = r['CORR_ID']
-        a = r.get('CORR_MP_FLOAT')
-        b = r.get('CORR_ENDMP_FLOAT')
-        if a is None or b is None:
-            continue
-        temp.setdefault(corr, []).append(
-            (float(a), float(b), r['SEGMENT_KEY']))
+    sub = segments_df.dropna(subset=['CORR_MP_FLOAT', 'CORR_ENDMP_FLOAT'])
+    starts = sub['CORR_MP_FLOAT'].to_numpy(dtype=float)
+    ends = sub['CORR_ENDMP_FLOAT'].to_numpy(dtype=float)
+    keys = sub['SEGMENT_KEY'].to_numpy(dtype=object)
+    codes, corridors = pd.factorize(sub['CORR_ID'])
+
+    # sort by corridor, then start milepost; lexsort is stable so ties keep row order
+    order = np.lexsort((starts, codes))
+    groups = np.split(order, np.flatnonzero(np.diff(codes[order])) + 1)
 
     corridor_index = {}
-    for corr, intervals in temp.items():
-        intervals.sort(key=lambda x: x[0])
-        starts = np.array([it[0] for it in intervals], dtype=float)
-        ends = np.array([it[1] for it in intervals], dtype=float)
-        keys = [it[2] for it in intervals]
-        corridor_index[corr] = {'starts': starts, 'ends': ends, 'keys': keys}
+    for rows in groups:
+        if len(rows) == 0:
+            continue
+        corridor_index[corridors[codes[rows[0]]]] = {
+            'starts': starts[rows], 'ends': ends[rows], 'keys': keys[rows]}
     return corridor_index
 
 
 def match_crash_to_section_vectorized(crashes_df, corridor_index):
-    s = pd.Series(index=crashes_df.index, dtype=object)
     # parse REF_POINT to float mileposts
-    ref_floats = crashes_df.get('REF_POINT').apply(parse_milepost)
+    refs = parse_milepost_series(crashes_df.get('REF_POINT')).to_numpy(dtype=float)
     corridors = crashes_df.get('CORRIDOR').astype(str).str.strip().str.upper()
-
-    # group by corridor to limit search
-    for corr, group_idxs in corridors.groupby(corridors).groups.items():
-        if corr not in corridor_index:
-            s.loc[list(group_idxs)] = None
-            continue
-        starts = corridor_index[corr]['starts']
-        ends = corridor_index[corr]['ends']
-        keys = corridor_index[corr]['keys']
-        sub_refs = ref_floats.loc[list(group_idxs)].to_numpy(dtype=float)
-        nan_mask = np.isnan(sub_refs)
-        cand = np.searchsorted(starts, sub_refs, side='right') - 1
-        out = [None] * len(sub_refs)
-        for i, (ref, ci, is_nan) in enumerate(zip(sub_refs, cand, nan_mask)):
-            if is_nan or ci < 0 or ci >= len(starts):
-                out[i] = None
-            else:
-                out[i] = keys[ci] if ref <= ends[ci] else None
-        s.loc[list(group_idxs)] = out
-    return s
+    out = np.full(len(refs), None, dtype=object)
+    if not corridor_index:
+        return pd.Series(out, index=crashes_df.index)
+
+    # flatten the per-corridor intervals; corridor i owns offsets[i]:offsets[i + 1]
+    entries = list(corridor_index.values())
+    starts_all = np.concatenate([e['starts'] for e in entries])
+    ends_all = np.concatenate([e['ends'] for e in entries])
+    keys_all = np.concatenate([e['keys'] for e in entries])
+    offsets = np.concatenate(
+        ([0], np.cumsum([len(e['starts']) for e in entries])))
+
+    # integer corridor id per crash (-1 when the corridor has no segments)
+    cids = pd.Index(list(corridor_index)).get_indexer(corridors)
+    seg_cids = np.repeat(np.arange(len(entries)), np.diff(offsets))
+
+    # merge crashes into the (corridor, start) ordering of the segments; the
+    # candidate for a crash is the last segment placed before it. Segments sort
+    # ahead of crashes on equal starts, matching searchsorted(side='right').
+    n_seg = len(starts_all)
+    is_crash = np.concatenate(
+        (np.zeros(n_seg, dtype=bool), np.ones(len(refs), dtype=bool)))
+    order = np.lexsort((is_crash, np.concatenate((starts_all, refs)),
+                        np.concatenate((seg_cids, cids))))
+    crash_pos = is_crash[order]
+    cand = np.empty(len(refs), dtype=np.intp)
+    cand[order[crash_pos] - n_seg] = np.cumsum(~crash_pos)[crash_pos] - 1
+
+    # the candidate must be on the same corridor and reach the crash; NaN refs
+    # fail the <= check
+    hit = np.full(len(refs), -1, dtype=np.intp)
+    ok = (cids >= 0) & (cand >= 0)
+    ok[ok] = (seg_cids[cand[ok]] == cids[ok]) & (refs[ok] <= ends_all[cand[ok]])
+    hit[ok] = cand[ok]
+
+    matched = hit >= 0
+    out[matched] = keys_all[hit[matched]]
+    return pd.Series(out, index=crashes_df.index)
 
 
 def match_crash_to_section(crash_row, corridor_index):
@@ -131,6 +188,28 @@ def match_crash_to_section(crash_row, corridor_index):
     return None
 
 
+class _TycProperties(msgspec.Struct):
+    # only the fields that make up SEGMENT_KEY; msgspec skips everything else.
+    # Typed Any so numbers/nulls come through and get str() as before.
+    CORR_ID: Any = ''
+    DEPT_ID: Any = ''
+    CORR_MP: Any = ''
+    CORR_ENDMP: Any = ''
+
+
+class _TycFeature(msgspec.Struct):
+    # GeoJSON allows "properties": null
+    properties: Optional[_TycProperties] = None
+    geometry: Any = None
+
+
+class _TycFeatureCollection(msgspec.Struct):
+    features: List[_TycFeature] = []
+
+
+_EMPTY_TYC_PROPERTIES = _TycProperties()
+
+
 def load_tyc_geojson_map(years, base_dir='data/Traffic_Yearly_Counts', needed_keys=None):
     combined = {}
     for year in years:
@@ -145,15 +224,20 @@ def load_tyc_geojson_map(years, base_dir='data/Traffic_Yearly_Counts', needed_ke
                     # read as bytes and decode with msgspec for speed
                     with open(path, 'rb') as fh:
                         raw = fh.read()
-                    js = msgspec.json.decode(raw)
+                    js = msgspec.json.decode(raw, type=_TycFeatureCollection)
+                except msgspec.ValidationError as e:
+                    # the file parsed but doesn't look like TYC GeoJSON; don't
+                    # silently drop every geometry for the year
+                    raise msgspec.ValidationError(f"{path}: {e}") from e
                 except Exception:
                     continue
-                for feat in js.get('features', []):
-                    p = feat.get('properties', {})
-                    corr_id = str(p.get('CORR_ID', '')).strip().upper()
-                    dept_id = str(p.get('DEPT_ID', '')).strip().upper()
-                    corr_mp = str(p.get('CORR_MP', ''))
-                    corr_endmp = str(p.get('CORR_ENDMP', ''))
+                for feat in js.features:
+                    # null/missing properties key the same as empty ones
+                    p = feat.properties or _EMPTY_TYC_PROPERTIES
+                    corr_id = str(p.CORR_ID).strip().upper()
+                    dept_id = str(p.DEPT_ID).strip().upper()
+                    corr_mp = str(p.CORR_MP)
+                    corr_endmp = str(p.CORR_ENDMP)
                     key = f"{corr_id}_{corr_mp}_{corr_endmp}_{dept_id}"
                     if needed_keys is not None and key not in needed_keys:
                         continue
@@ -179,6 +263,14 @@ def _strip_trailing_letter(s):
     return s
 
 
+def _strip_trailing_letter_series(routes):
+    """Vectorized _strip_trailing_letter over a Series; missing values stay
+    missing."""
+    s = routes.str.strip().str.upper()
+    has_letter = s.str[-1].str.isalpha().eq(True)
+    return s.str[:-1].where(has_letter, s)
+
+
 def load_on_system_routes_map(csv_path='raw-mdt-source-data/Montana_On_System_Routes_OD.csv'):
     """Load the Montana on-system routes file and return a mapping from
     departmental route (stripped of trailing letter) -> SIGNED ROUTE.
@@ -189,24 +281,23 @@ def load_on_system_routes_map(csv_path='raw-mdt-source-data/Montana_On_System_Ro
     if not os.path.exists(csv_path):
         return {}
     try:
-        rdf = pd.read_csv(csv_path, dtype=str)
+        rdf = pd.read_csv(csv_path, dtype=str,
+                          usecols=lambda c: c in ON_SYSTEM_COLUMNS)
     except Exception:
         return {}
-    mapping = {}
     # column names in the file: 'DEPARTMENTAL ROUTE' and 'SIGNED ROUTE'
-    for _, r in rdf.iterrows():
-        dep = r.get('DEPARTMENTAL ROUTE') or r.get(
-            'DEPARTMENTAL ROUTE'.upper())
-        signed = r.get('SIGNED ROUTE') or r.get('SIGNED ROUTE'.upper())
-        if pd.isna(dep):
-            continue
-        key = _strip_trailing_letter(dep)
-        if not key:
-            continue
-        signed_val = '' if pd.isna(signed) else str(signed).strip()
-        # prefer the first non-empty signed route
-        if key not in mapping or (not mapping[key] and signed_val):
-            mapping[key] = signed_val
+    if 'DEPARTMENTAL ROUTE' not in rdf.columns:
+        return {}
+    keys = _strip_trailing_letter_series(rdf['DEPARTMENTAL ROUTE'])
+    signed = rdf.get('SIGNED ROUTE', pd.Series('', index=rdf.index))
+    signed = signed.fillna('').astype(str).str.strip()
+    valid = keys.notna() & (keys != '')
+    keys, signed = keys[valid], signed[valid]
+    # every key is present (in file order); prefer the first non-empty signed route
+    mapping = dict.fromkeys(keys, '')
+    firsts = pd.DataFrame({'key': keys, 'signed': signed})[
+        signed != ''].drop_duplicates('key')
+    mapping.update(zip(firsts['key'], firsts['signed']))
     return mapping
 
 
@@ -252,6 +343,21 @@ def point_on_linestring(geometry, prefer='midpoint'):
     return coords[-1]
 
 
+def write_feature_collection(features, path):
+    """Write features as a GeoJSON FeatureCollection one feature at a time so the
+    whole collection is never serialized into a single string in memory."""
+    encoder = msgspec.json.Encoder()
+    buf = bytearray()
+    with open(path, 'wb', buffering=1 << 20) as fh:
+        fh.write(b'{"type":"FeatureCollection","features":[')
+        for i, feature in enumerate(features):
+            if i:
+                fh.write(b',')
+            encoder.encode_into(feature, buf)
+            fh.write(buf)
+        fh.write(b']}')
+
+
 def main(crash_csv='raw-mdt-source-data/2019-2023-crash-data.csv', years=[2023, 2022, 2021, 2020, 2019], out_dir='output/merged_data'):
     os.makedirs(out_dir, exist_ok=True)
     base = load_base_segments_2023()
@@ -261,38 +367,35 @@ def main(crash_csv='raw-mdt-source-data/2019-2023-crash-data.csv', years=[2023,
     # load on-system routes mapping: departmental route (stripped) -> SIGNED ROUTE
     on_system_map = load_on_system_routes_map()
 
-    crashes = pd.read_csv(crash_csv, dtype=str)
+    # only the corridor and reference point are needed to match crashes to segments
+    crashes = pd.read_csv(crash_csv, dtype=str, usecols=['CORRIDOR', 'REF_POINT'])
     crashes['CORRIDOR'] = crashes['CORRIDOR'].astype(
         str).str.strip().str.upper()
 
     matched_series = match_crash_to_section_vectorized(crashes, corridor_index)
     crash_counts = matched_series.dropna().value_counts().to_dict()
 
-    # compute metrics
-    df = averaged.copy()
-    df['SEC_LNT_MI'] = pd.to_numeric(
-        df.get('SEC_LNT_MI', None), errors='coerce')
-    df['TYC_AADT'] = pd.to_numeric(df.get('TYC_AADT', None), errors='coerce')
-    df['MILES_DRIVEN'] = df['SEC_LNT_MI'] * df['TYC_AADT']
+    # compute metrics on just the columns the output needs
+    df = averaged.reindex(columns=['SEGMENT_KEY', 'CORR_ID', 'CORR_MP', 'CORR_ENDMP',
+                                   'DEPT_ID', 'SEC_LNT_MI', 'TYC_AADT'])
+    df['SEC_LNT_MI'] = pd.to_numeric(df['SEC_LNT_MI'], errors='coerce')
+    df['TYC_AADT'] = pd.to_numeric(df['TYC_AADT'], errors='coerce')
+    miles_driven = df['SEC_LNT_MI'] * df['TYC_AADT']
     total_years = len(years)
     df['TOTAL_CRASHES'] = df['SEGMENT_KEY'].map(
         crash_counts).fillna(0).astype(int)
     df['AVG_CRASHES'] = df['TOTAL_CRASHES'] / total_years
     # TODO: change this if the year range changes
     # 365.20 instead of .25 because there is 1 leap year in the 5-year span we looked at (2019-2023, only 2020 was a leap year).
-    df['ANNUAL_VMT'] = df['MILES_DRIVEN'] * 365.20
-    df['PER_100M_VMT'] = None
-    mask = df['ANNUAL_VMT'].notna() & (df['ANNUAL_VMT'] > 0)
-    df.loc[mask, 'PER_100M_VMT'] = (
-        df.loc[mask, 'AVG_CRASHES'] / df.loc[mask, 'ANNUAL_VMT']) * 100_000_000
+    annual_vmt = miles_driven * 365.20
+    mask = annual_vmt.notna() & (annual_vmt > 0)
+    df['PER_100M_VMT'] = (
+        df['AVG_CRASHES'] / annual_vmt * 100_000_000).where(mask)
 
     # load geometries lazily: only for needed segment keys
 
     # filter low-volume segments and departmental prefixes (exclude R, L, X, U)
-    filtered = df.copy()
-    filtered['TYC_AADT_NUM'] = pd.to_numeric(
-        filtered.get('TYC_AADT', ''), errors='coerce')
-    filtered = filtered[filtered['TYC_AADT_NUM'] >= 1]
+    filtered = df[df['TYC_AADT'] >= 1]
     depts_exclude = ('R', 'L', 'X', 'U')
     dept_upper = filtered['DEPT_ID'].astype(str).str.strip().str.upper()
     # exclude prefixes R/L/X/U but explicitly keep a small list of U- routes
@@ -309,45 +412,50 @@ def main(crash_csv='raw-mdt-source-data/2019-2023-crash-data.csv', years=[2023,
     needed_keys = set(filtered['SEGMENT_KEY'].tolist())
     geo_map = load_tyc_geojson_map(years, needed_keys=needed_keys)
 
+    # build every property column once, then emit features from plain records
+    sec_lnt = filtered['SEC_LNT_MI']
+    per_vmt = filtered['PER_100M_VMT']
+    aadt = filtered['TYC_AADT']
+    aadt_is_int = aadt.notna() & (aadt % 1 == 0)
+    props_df = pd.DataFrame({
+        'SEGMENT_KEY': filtered['SEGMENT_KEY'],
+        'CORRIDOR': filtered['CORR_ID'],
+        'CORR_MP': filtered['CORR_MP'],
+        'CORR_ENDMP': filtered['CORR_ENDMP'],
+        'DEPT_ID': filtered['DEPT_ID'],
+        'SEC_LNT_MI': sec_lnt.astype(object).where(sec_lnt.notna(), ''),
+        # look up SIGNED_ROUTE: match DEPT_ID (strip trailing letter) to mapping
+        'SIGNED_ROUTE': _strip_trailing_letter_series(
+            filtered['DEPT_ID']).map(on_system_map).fillna(''),
+        'TOTAL_CRASHES': filtered['TOTAL_CRASHES'].astype(int),
+        'AVG_CRASHES': filtered['AVG_CRASHES'].astype(float),
+        'PER_100M_VMT': per_vmt.astype(object).where(per_vmt.notna(), ''),
+        'TYC_AADT': aadt.astype(object).where(aadt.notna(), '').mask(
+            aadt_is_int, aadt.where(aadt_is_int, 0).astype('int64').astype(object)),
+    })
+
     lines = []
-    for _, row in filtered.iterrows():
-        seg_key = row['SEGMENT_KEY']
-        if seg_key not in geo_map:
+    kept_rows = []
+    for i, props in enumerate(props_df.to_dict(orient='records')):
+        feat = geo_map.get(props['SEGMENT_KEY'])
+        if feat is None:
             continue
-        feat = geo_map[seg_key]
-        geom = feat.get('geometry')
+        geom = feat.geometry
         if geom is None:
             continue
-        # look up SIGNED_ROUTE: match DEPT_ID (strip trailing letter) to mapping
-        dept = row.get('DEPT_ID', '')
-        dept_key = _strip_trailing_letter(dept)
-        signed_route = on_system_map.get(dept_key, '')
-
-        props = {
-            'SEGMENT_KEY': seg_key,
-            'CORRIDOR': row.get('CORR_ID', ''),
-            'CORR_MP': row.get('CORR_MP', ''),
-            'CORR_ENDMP': row.get('CORR_ENDMP', ''),
-            'DEPT_ID': row.get('DEPT_ID', ''),
-            'SEC_LNT_MI': float(row.get('SEC_LNT_MI')) if pd.notna(row.get('SEC_LNT_MI')) else '',
-            'SIGNED_ROUTE': signed_route,
-            'TOTAL_CRASHES': int(row.get('TOTAL_CRASHES', 0)),
-            'AVG_CRASHES': float(row.get('AVG_CRASHES', 0.0)),
-            'PER_100M_VMT': float(row.get('PER_100M_VMT')) if pd.notna(row.get('PER_100M_VMT')) else '',
-            'TYC_AADT': int(row['TYC_AADT']) if pd.notna(row.get('TYC_AADT')) and float(row['TYC_AADT']).is_integer() else (float(row['TYC_AADT']) if pd.notna(row.get('TYC_AADT')) else ''),
-        }
         lines.append(
             {'type': 'Feature', 'geometry': geom, 'properties': props})
+        kept_rows.append(i)
 
-    lines_gc = {'type': 'FeatureCollection', 'features': lines}
-    with open(os.path.join(out_dir, 'merged_traffic_lines.geojson'), 'w') as lf:
-        json.dump(lines_gc, lf)
+    write_feature_collection(lines, os.path.join(
+        out_dir, 'merged_traffic_lines.geojson'))
 
     # Create CSV version for lines (without geometry data)
     if lines:
-        # preserve property keys (SIGNED_ROUTE included)
-        lines_df = pd.DataFrame([feature['properties'] for feature in lines])
-        lines_df.to_csv(os.path.join(
+        # same rows and columns as the features' properties, straight from the
+        # column frame rather than rebuilt from the per-feature dicts;
+        # infer_objects gives the column dtypes the dict-built frame had
+        props_df.iloc[kept_rows].infer_objects().to_csv(os.path.join(
             out_dir, 'merged_traffic_lines.csv'), index=False)
 
     print(f"Wrote {len(lines)} lines to {out_dir}")
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
-import json
 import os
-import re
-from math import floor
-from typing import Dict
+from math import sin
+from string import ascii_letters
+from typing import List
+
+import msgspec
+import numpy as np
 
 
 
@@ -21,6 +23,9 @@ MAX_DISTANCE_M = 50.0
 MAX_BEARING_DIFF = 30.0
 # fraction of sampled points that must match to consider the simplified line matched
 MATCH_FRACTION = 0.25
+# simplified features matched per batch; bounds the candidate arrays built
+# by point_matches_index_batch (~50 candidates per sample) to a few tens of MB
+MATCH_BATCH_FEATURES = 1000
 OUTPUT_DIR = os.path.join("output", "mini_highways")
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, "mini_mt_highways-1m.json")
 
@@ -31,11 +36,9 @@ def refpt_to_float(ref: str) -> float:
     if ref is None:
         return 0.0
     # common format: '663+0.0150' or '000+0.0000'
-    m = re.match(r"^(\d+)\+(\d*\.?\d*)$", str(ref).strip())
-    if m:
-        major = int(m.group(1))
-        minor = float(m.group(2)) if m.group(2) != "" else 0.0
-        return major + minor
+    major, sep, minor = str(ref).strip().partition("+")
+    if sep and major.isdecimal() and (not minor or minor.replace(".", "", 1).isdecimal()):
+        return int(major) + (float(minor) if minor else 0.0)
     # fallback: try float
     try:
         return float(ref)
@@ -48,99 +51,127 @@ def route_id_base(route_id: str) -> str:
     if not route_id:
         return ""
     # remove trailing alpha characters
-    return re.sub(r"[A-Za-z]+$", "", route_id)
+    return route_id.rstrip(ascii_letters)
+
+
+class _RawFeatureCollection(msgspec.Struct):
+    # features left as raw JSON; each is decoded when it is visited
+    features: List[msgspec.Raw] = []
+
+
+def load_feature_blobs(path: str) -> List[msgspec.Raw]:
+    # undecoded features of a FeatureCollection; they reference the file
+    # buffer, so only the feature being processed is ever a Python dict
+    with open(path, "rb") as fh:
+        return msgspec.json.decode(fh.read(), type=_RawFeatureCollection).features
+
 
+def write_feature_collection(features, path: str) -> None:
+    # stream raw features into a compact FeatureCollection one at a time, so the
+    # collection is never encoded into a single buffer
+    with open(path, "wb", buffering=1 << 20) as fh:
+        fh.write(b'{"type":"FeatureCollection","features":[')
+        for i, raw in enumerate(features):
+            if i:
+                fh.write(b",")
+            fh.write(raw)
+        fh.write(b"]}")
 
-def load_geojson(path: str) -> Dict:
-    with open(path, "r", encoding="utf-8") as fh:
-        return json.load(fh)
 
+def haversine_a_np(lon1, lat1, lons2, lats2):
+    # the haversine "a" term (squared half-chord); monotonic in distance, so
+    # threshold tests can compare it directly and skip the sqrt/atan2
+    lat1 = np.radians(lat1)
+    lats2 = np.radians(lats2)
+    dlat = lats2 - lat1
+    dlon = np.radians(lons2 - lon1)
+    return np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lats2) * np.sin(dlon / 2) ** 2
 
-def haversine(lon1, lat1, lon2, lat2):
-    # returns meters
-    from math import radians, sin, cos, sqrt, atan2
 
+def haversine_a_pre(lon1, lat1_rad, cos_lat1, lons2, lats2_rad, cos_lats2):
+    # haversine_a_np with latitudes already in radians and their cosines
+    # precomputed, as stored in the merged index bins
+    dlat = lats2_rad - lat1_rad
+    dlon = np.radians(lons2 - lon1)
+    return np.sin(dlat / 2) ** 2 + cos_lat1 * cos_lats2 * np.sin(dlon / 2) ** 2
+
+
+def haversine_np(lon1, lat1, lons2, lats2):
+    # haversine from one point to arrays of points; returns meters array
     R = 6371000.0
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    a = haversine_a_np(lon1, lat1, lons2, lats2)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
     return R * c
 
 
-def bearing(lon1, lat1, lon2, lat2):
-    # returns degrees 0-360
-    from math import radians, degrees, sin, cos, atan2
+def max_haversine_a(max_dist_m):
+    # "a" term at max_dist_m: a <= max_haversine_a(m)  <=>  distance <= m
+    R = 6371000.0
+    return sin(max_dist_m / (2 * R)) ** 2
 
-    lon1, lat1, lon2, lat2 = map(radians, (lon1, lat1, lon2, lat2))
+
+def bearing_np(lon1, lat1, lon2, lat2):
+    # vectorized bearing; returns degrees 0-360
+    lon1, lat1, lon2, lat2 = (np.radians(v) for v in (lon1, lat1, lon2, lat2))
     dlon = lon2 - lon1
-    x = sin(dlon) * cos(lat2)
-    y = cos(lat1) * sin(lat2) - sin(lat1) * cos(lat2) * cos(dlon)
-    br = degrees(atan2(x, y))
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    br = np.degrees(np.arctan2(x, y))
     return (br + 360) % 360
 
 
-def point_along_linestring(coords, fraction: float):
-    # coords is list of [lon, lat]; fraction between 0 and 1
-    if not coords:
-        return None
-    if fraction <= 0:
-        return coords[0]
-    if fraction >= 1:
-        return coords[-1]
-    # accumulate segment lengths (approx meters)
-    seg_lengths = []
-    total = 0.0
-    for i in range(len(coords) - 1):
-        a = coords[i]
-        b = coords[i + 1]
-        d = haversine(a[0], a[1], b[0], b[1])
-        seg_lengths.append(d)
-        total += d
-    if total == 0:
-        return coords[0]
-    target = total * fraction
-    acc = 0.0
-    for i, seg in enumerate(seg_lengths):
-        if acc + seg >= target:
-            # interpolate
-            remain = target - acc
-            t = remain / seg if seg != 0 else 0
-            a = coords[i]
-            b = coords[i + 1]
-            lon = a[0] + (b[0] - a[0]) * t
-            lat = a[1] + (b[1] - a[1]) * t
-            return [lon, lat]
-        acc += seg
-    return coords[-1]
+def sample_bearings(samples):
+    # bearing at each sample toward the next one; the last sample reuses the
+    # final segment's bearing (0.0 when there is only one sample)
+    if len(samples) < 2:
+        return np.zeros(len(samples))
+    brs = bearing_np(samples[:-1, 0], samples[:-1, 1], samples[1:, 0], samples[1:, 1])
+    return np.append(brs, brs[-1])
 
 
 def sample_points(coords, n=10):
-    # return up to n sampled points along linestring (lon, lat)
+    # return up to n sampled points along linestring as an (n, 2) array of
+    # (lon, lat), evenly spaced by haversine distance at fractions i / (n - 1);
+    # the segment lengths are computed once instead of once per sample
     if not coords:
-        return []
-    if len(coords) == 1:
-        return [coords[0]]
-    pts = []
-    for i in range(n):
-        frac = i / (n - 1) if n > 1 else 0
-        pt = point_along_linestring(coords, frac)
-        if pt:
-            pts.append(pt)
-    return pts
+        return np.empty((0, 2))
+    pts = np.asarray([c[:2] for c in coords], dtype=float)
+    if len(pts) == 1:
+        return pts
+    seg_lengths = haversine_np(pts[:-1, 0], pts[:-1, 1], pts[1:, 0], pts[1:, 1])
+    cum = np.cumsum(seg_lengths)
+    total = cum[-1]
+    fracs = np.arange(n) / (n - 1) if n > 1 else np.zeros(1)
+
+    out = np.empty((len(fracs), 2))
+    out[:] = pts[0]
+    out[fracs >= 1] = pts[-1]
+    inner = (fracs > 0) & (fracs < 1)
+    if total == 0 or not inner.any():
+        return out
+    # first segment whose cumulative length reaches the target, then interpolate
+    target = total * fracs[inner]
+    seg = np.searchsorted(cum, target, side="left")
+    found = seg < len(seg_lengths)
+    seg_c = np.minimum(seg, len(seg_lengths) - 1)
+    acc = np.concatenate(([0.0], cum[:-1]))[seg_c]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(seg_lengths[seg_c] != 0, (target - acc) / seg_lengths[seg_c], 0.0)
+    a = pts[seg_c]
+    b = pts[seg_c + 1]
+    interp = a + (b - a) * t[:, None]
+    out[inner] = np.where(found[:, None], interp, pts[-1])
+    return out
 
 
 def build_merged_point_index(merged_features):
-    # build simple grid index (dict) mapping bin -> list of (lon, lat, bearing)
+    # build simple grid index (dict) mapping bin -> (lons, lats, bearings,
+    # lat radians, cos lat) arrays
     # bin size is degrees; small enough to reduce candidates but coarse enough
     # to keep memory low.
     BIN_SIZE_DEG = 0.01  # ~1.1 km latitude
-    from math import floor
 
-    def to_bin(lon, lat):
-        return (int(floor(lon / BIN_SIZE_DEG)), int(floor(lat / BIN_SIZE_DEG)))
-
-    index = {}
+    lon_parts, lat_parts, br_parts = [], [], []
     for f in merged_features:
         geom = f.get("geometry") or {}
         if geom.get("type") != "LineString":
@@ -148,46 +179,99 @@ def build_merged_point_index(merged_features):
         coords = geom.get("coordinates", [])
         # reduced sample density for large datasets
         pts = sample_points(coords, n=12)
-        for i in range(len(pts) - 1):
-            a = pts[i]
-            b = pts[i + 1]
-            br = bearing(a[0], a[1], b[0], b[1])
-            bin_key = to_bin(a[0], a[1])
-            index.setdefault(bin_key, []).append((a[0], a[1], br))
-        if pts:
-            if len(pts) >= 2:
-                a = pts[-2]
-                b = pts[-1]
-                br = bearing(a[0], a[1], b[0], b[1])
-            else:
-                br = 0.0
-            bin_key = to_bin(pts[-1][0], pts[-1][1])
-            index.setdefault(bin_key, []).append((pts[-1][0], pts[-1][1], br))
+        lon_parts.append(pts[:, 0])
+        lat_parts.append(pts[:, 1])
+        br_parts.append(sample_bearings(pts))
+    if not lon_parts:
+        return {"bins": {}, "bin_size": BIN_SIZE_DEG}
+
+    # bin every sample at once, then sort by bin (stable, so each bin keeps
+    # sample order) and cut the sorted arrays into one slice per bin
+    lons = np.concatenate(lon_parts)
+    lats = np.concatenate(lat_parts)
+    bxs = np.floor(lons / BIN_SIZE_DEG).astype(np.int64)
+    bys = np.floor(lats / BIN_SIZE_DEG).astype(np.int64)
+    order = np.lexsort((bys, bxs))
+    bxs, bys = bxs[order], bys[order]
+    # rows are each contiguous, for batch distance tests; latitude radians and
+    # cosines never change, so they are computed here once rather than per query
+    lat_rads = np.radians(lats[order])
+    table = np.vstack((lons[order], lats[order], np.concatenate(br_parts)[order],
+                       lat_rads, np.cos(lat_rads)))
+    cuts = np.flatnonzero((np.diff(bxs) != 0) | (np.diff(bys) != 0)) + 1
+    starts = np.concatenate(([0], cuts))
+    ends = np.append(cuts, len(bxs))
+    index = {(int(bxs[lo]), int(bys[lo])): table[:, lo:hi]
+             for lo, hi in zip(starts.tolist(), ends.tolist())}
     return {"bins": index, "bin_size": BIN_SIZE_DEG}
 
 
-def point_matches_index(lon, lat, br, index, max_dist_m=MAX_DISTANCE_M, max_bearing_diff=MAX_BEARING_DIFF):
-    # index is a dict with 'bins' and 'bin_size'
-    bins = index.get("bins", {})
-    bin_size = index.get("bin_size", 0.01)
+def bin_halo(index, bx, by):
+    # the 3x3 neighbourhood of bin (bx, by) concatenated into one array (None
+    # when empty); memoized in the index since nearby samples share halos
+    halos = index.setdefault("halos", {})
+    key = (bx, by)
+    if key not in halos:
+        bins = index.get("bins", {})
+        parts = [bins[k] for k in ((bx + dx, by + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1))
+                 if k in bins]
+        halos[key] = np.concatenate(parts, axis=1) if parts else None
+    return halos[key]
 
-    bx = int(floor(lon / bin_size))
-    by = int(floor(lat / bin_size))
 
-    # check neighboring bins (3x3) to cover small distances
-    rng = 1
-    for dx in range(-rng, rng + 1):
-        for dy in range(-rng, rng + 1):
-            key = (bx + dx, by + dy)
-            if key not in bins:
-                continue
-            for ilon, ilat, ibr in bins[key]:
-                d = haversine(lon, lat, ilon, ilat)
-                if d <= max_dist_m:
-                    diff = abs((br - ibr + 180) % 360 - 180)
-                    if diff <= max_bearing_diff:
-                        return True
-    return False
+def point_matches_index_batch(lons, lats, brs, index, max_dist_m=MAX_DISTANCE_M, max_bearing_diff=MAX_BEARING_DIFF):
+    # whether each query point has an indexed point within max_dist_m and
+    # max_bearing_diff degrees; returns a bool array
+    bin_size = index.get("bin_size", 0.01)
+
+    bxs = np.floor(lons / bin_size).astype(int).tolist()
+    bys = np.floor(lats / bin_size).astype(int).tolist()
+
+    # gather the 3x3 neighbourhood of every query, remembering which query
+    # each candidate belongs to
+    candidates = []
+    owners = []
+    for q, (bx, by) in enumerate(zip(bxs, bys)):
+        halo = bin_halo(index, bx, by)
+        if halo is not None:
+            candidates.append(halo)
+            owners.append(q)
+    if not candidates:
+        return np.zeros(len(lons), dtype=bool)
+    cand_lons, _, cand_brs, cand_lat_rads, cand_cos_lats = np.concatenate(candidates, axis=1)
+    q = np.repeat(owners, [c.shape[1] for c in candidates])
+    lat_rads = np.radians(lats)
+    cos_lats = np.cos(lat_rads)
+    a = haversine_a_pre(lons[q], lat_rads[q], cos_lats[q], cand_lons, cand_lat_rads, cand_cos_lats)
+    # bearings are in [0, 360), so the wrapped difference is min(d, 360 - d)
+    diff = np.abs(brs[q] - cand_brs)
+    diff = np.minimum(diff, 360 - diff)
+    hit = (a <= max_haversine_a(max_dist_m)) & (diff <= max_bearing_diff)
+    return np.bincount(q[hit], minlength=len(lons)) > 0
+
+
+def _batch_hits(batch, index):
+    # matching-sample count for each (n >= 2, 2) sample array in batch
+    samples = np.concatenate(batch)
+    brs = np.concatenate([sample_bearings(smp) for smp in batch])
+    matched = point_matches_index_batch(samples[:, 0], samples[:, 1], brs, index)
+    offsets = np.cumsum([0] + [len(smp) for smp in batch[:-1]])
+    return np.add.reduceat(matched.astype(int), offsets)
+
+
+def count_sample_hits(sample_sets, index):
+    # matching samples for each feature's (n, 2) samples, matched in batches
+    # of features rather than one feature at a time; None or fewer than 2
+    # samples means no bearing, so never a match
+    hits = np.zeros(len(sample_sets), dtype=int)
+    usable = [i for i, smp in enumerate(sample_sets) if smp is not None and len(smp) >= 2]
+    batches = [usable[start:start + MATCH_BATCH_FEATURES]
+               for start in range(0, len(usable), MATCH_BATCH_FEATURES)]
+    sample_batches = [[sample_sets[i] for i in batch] for batch in batches]
+
+    for batch, smp in zip(batches, sample_batches):
+        hits[batch] = _batch_hits(smp, index)
+    return hits
 
 
 def main() -> None:
@@ -201,15 +285,14 @@ def main() -> None:
         tried = [merged_traffic_simplified, merged_path]
         raise FileNotFoundError(f"Could not find merged traffic file; tried: {tried}")
 
-    merged = load_geojson(merged_path)
     simplified_path = find_simplified_input()
-    simplified = load_geojson(simplified_path)
 
     # Choose matching mode: 'geometry' for spatial matching, 'signed' for route-name
     MODE = "geometry"
 
-    merged_features = merged.get("features", [])
-    simplified_features = simplified.get("features", [])
+    # features stay raw until visited; kept ones are written back unchanged
+    merged_features = (msgspec.json.decode(raw) for raw in load_feature_blobs(merged_path))
+    simplified_features = load_feature_blobs(simplified_path)
 
     if MODE == "signed":
         merged_signed_routes = set()
@@ -221,15 +304,24 @@ def main() -> None:
             merged_signed_routes.add(str(signed).strip().upper())
     else:
         merged_point_index = build_merged_point_index(merged_features)
+        # sample every simplified line up front so matching runs in batches
+        # across features; None for non-lines
+        feature_samples = []
+        for raw in simplified_features:
+            geom = msgspec.json.decode(raw).get("geometry") or {}
+            if geom.get("type") != "LineString":
+                feature_samples.append(None)
+            else:
+                feature_samples.append(sample_points(geom.get("coordinates", []), n=12))
+        feature_hits = count_sample_hits(feature_samples, merged_point_index)
 
     kept = []
     removed_count = 0
     kept_count = 0
 
-    for f in simplified_features:
-        p = f.get("properties", {})
-
+    for i, f in enumerate(simplified_features):
         if MODE == "signed":
+            p = msgspec.json.decode(f).get("properties", {})
             sign_route = p.get("SIGN_ROUTE")
             if sign_route is not None and str(sign_route).strip().upper() in merged_signed_routes:
                 removed_count += 1
@@ -237,32 +329,17 @@ def main() -> None:
             kept.append(f)
             kept_count += 1
         else:
-            geom = f.get("geometry") or {}
-            if geom.get("type") != "LineString":
+            samples = feature_samples[i]
+            if samples is None:
                 # keep non-lines by default
                 kept.append(f)
                 kept_count += 1
                 continue
-            coords = geom.get("coordinates", [])
-            samples = sample_points(coords, n=12)
-            if not samples:
+            if len(samples) == 0:
                 kept.append(f)
                 kept_count += 1
                 continue
-            match_hits = 0
-            for i in range(len(samples) - 1):
-                a = samples[i]
-                b = samples[i + 1]
-                br = bearing(a[0], a[1], b[0], b[1])
-                if point_matches_index(a[0], a[1], br, merged_point_index):
-                    match_hits += 1
-            # also check last point
-            if len(samples) >= 2:
-                a = samples[-2]
-                b = samples[-1]
-                br = bearing(a[0], a[1], b[0], b[1])
-                if point_matches_index(samples[-1][0], samples[-1][1], br, merged_point_index):
-                    match_hits += 1
+            match_hits = int(feature_hits[i])
 
             frac = match_hits / max(1, len(samples))
             if frac >= MATCH_FRACTION:
@@ -271,11 +348,8 @@ def main() -> None:
                 kept.append(f)
                 kept_count += 1
 
-    out = {"type": "FeatureCollection", "features": kept}
-
     # write compact JSON (no indentation) to reduce file size
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as fh:
-        json.dump(out, fh, ensure_ascii=False, separators=(",", ":"))
+    write_feature_collection(kept, OUTPUT_FILE)
 
     total_simplified = len(simplified_features)
     print(f"Total simplified features: {total_simplified}")